@@ -1,8 +1,8 @@
 # app.py
 import streamlit as st
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import BytesIO
-import time
 
 from logic.transformers import transformar_csv_exchange
 from logic.tax_calculator import (
@@ -12,6 +12,9 @@ from logic.tax_calculator import (
 )
 from logic.report_generator import exportar_excel
 
+# Columnas de cuota que devuelven calcular_irpf_* (en minúsculas)
+IRPF_COLS = frozenset({'irpf', 'cuota_irpf', 'irpf_ingresos_eur', 'irpf_ganancias_eur'})
+
 def extraer_cuota(irpf_ret):
     """
     Dado el retorno de calcular_irpf_* (tuple o DataFrame),
@@ -21,13 +24,32 @@ def extraer_cuota(irpf_ret):
         _, cuota = irpf_ret
         return float(cuota)
     if isinstance(irpf_ret, pd.DataFrame) and not irpf_ret.empty:
-        for col in irpf_ret.columns:
-            if 'irpf' in col.lower():
-                return float(irpf_ret[col].iloc[0])
-        first_val = pd.to_numeric(irpf_ret.iloc[0, 0], errors='coerce')
+        cols_irpf = [c for c in irpf_ret.columns if c.lower() in IRPF_COLS]
+        if cols_irpf:
+            return float(irpf_ret[cols_irpf[0]].iat[0])
+        first_val = pd.to_numeric(irpf_ret.iat[0, 0], errors='coerce')
         return float(first_val) if not pd.isna(first_val) else 0.0
     return 0.0
 
+# Descargas simultáneas a Yahoo como mucho (entre todos los ficheros)
+MAX_DESCARGAS = 8
+
+def leer_y_transformar(f, exchange, hilos_precios):
+    """
+    Lee un CSV subido y lo pasa por transformar_csv_exchange.
+    Se ejecuta en un hilo del pool, así que no debe llamar a st.*.
+    """
+    df_raw = pd.read_csv(f, engine='pyarrow', dtype_backend='pyarrow')
+    return transformar_csv_exchange(df_raw, exchange, hilos_precios=hilos_precios)
+
+def rellenar_texto(df):
+    """
+    Sustituye NaN por "" solo en las columnas de texto, para st.table.
+    Las numéricas se quedan en float y Streamlit muestra sus NaN.
+    """
+    cols_texto = df.select_dtypes(include=['object', 'string']).columns
+    return df.fillna({c: "" for c in cols_texto})
+
 def main():
     st.set_page_config(page_title="Calculadora Impuestos Cripto 2024", layout="wide")
     st.title("📊 Calculadora de Ganancias/Pérdidas Cripto 2024")
@@ -45,44 +67,61 @@ def main():
     total = len(archivos)
     progress = st.progress(0)
     step = 0
-
-    # 3) Transformar y recopilar errores
-    dfs, errores_precio = [], []
-    for f in archivos:
-        df_raw = pd.read_csv(f)
-        try:
-            df_std, errs = transformar_csv_exchange(df_raw, exchange)
-        except ValueError as e:
-            st.error(f"«{f.name}»: {e}")
+    # Cada actualización es un viaje al navegador: como mucho ~10 por subida
+    cada = max(1, total // 10)
+
+    # 3) Leer y transformar en paralelo; la UI se actualiza desde este hilo.
+    #    Cada fichero abre su propio pool de descargas: se reparten MAX_DESCARGAS
+    #    entre ellos para no pasar del límite de Yahoo (que devolvería precios None)
+    resultados = [None] * total
+    hilos = min(MAX_DESCARGAS, total)
+    hilos_precios = max(1, MAX_DESCARGAS // hilos)
+    with ThreadPoolExecutor(max_workers=hilos) as ex:
+        futuros = {
+            ex.submit(leer_y_transformar, f, exchange, hilos_precios): i
+            for i, f in enumerate(archivos)
+        }
+        for fut in as_completed(futuros):
+            i = futuros[fut]
+            try:
+                resultados[i] = fut.result()
+            except ValueError as e:
+                st.error(f"«{archivos[i].name}»: {e}")
+                continue
+
+            # Actualizar progreso
+            step += 1
+            if step % cada == 0 or step == total:
+                progress.progress(step / total)
+
+    # Recopilar en el orden de subida
+    dfs, ingresos, errores_precio = [], [], []
+    for res in resultados:
+        if res is None:
             continue
+        df_std, errs = res
         dfs.append(df_std)
+        # Los ingresos se filtran por fichero, así el concat solo mueve esas filas
+        ingresos.append(
+            df_std[df_std['tipo']=="Ingreso"].dropna(subset=['cripto','valor_eur'])
+        )
         errores_precio.extend(errs)
 
-        # Actualizar progreso
-        step += 1
-        progress.progress(step / total)
-
     if not dfs:
         st.warning("No hay CSVs válidos.")
         return
 
     # 4–6) Conversión USD→EUR y limpieza
-    df_ops = pd.concat(dfs, ignore_index=True)
-    df_ops['fecha'] = pd.to_datetime(df_ops['fecha']).dt.date
-    df_ops = df_ops.sort_values('fecha')
+    df_all = pd.concat(dfs, ignore_index=True)
 
-    # 7) FIFO solo sobre ventas/pérdidas
-    df_resultados = calcular_fifo(df_ops)
+    # 7) FIFO solo sobre ventas/pérdidas (calcular_fifo parsea las fechas y
+    #    ordena de forma estable: las operaciones del mismo día mantienen su orden)
+    df_resultados = calcular_fifo(df_all)
     if 'fecha_venta' in df_resultados.columns:
         df_resultados = df_resultados.rename(columns={'fecha_venta': 'fecha'})
 
     # 7b) Ingresos cripto
-    df_ingresos = pd.concat(dfs, ignore_index=True)
-    df_ingresos = (
-        df_ingresos[df_ingresos['tipo']=="Ingreso"]
-                   .dropna(subset=['cripto','valor_eur'])
-                   .reset_index(drop=True)
-    )
+    df_ingresos = pd.concat(ingresos, ignore_index=True)
 
     # 8a) Ganancias patrimoniales
     st.subheader("🔍 Detalle de ventas con lotes origen (FIFO)")
@@ -92,7 +131,7 @@ def main():
         "ganancia_perdida_eur", "lotes_origen_info"
     ]
     cols_existentes = [c for c in cols_detalle if c in df_resultados.columns]
-    st.dataframe(df_resultados[cols_existentes].fillna(""))
+    st.dataframe(df_resultados[cols_existentes], hide_index=True)
 
     st.markdown("---")
 
@@ -105,7 +144,7 @@ def main():
     totales = df_gan.groupby("cripto")["ganancia"].sum()
     validas = totales[totales != 0].index
     df_gan = df_gan[df_gan["cripto"].isin(validas)]
-    st.table(df_gan.fillna(""))
+    st.table(rellenar_texto(df_gan))
 
     ganancia_neta = df_gan['ganancia'].sum()
     cuota_irpf_gan = extraer_cuota(calcular_irpf_ganancias(df_resultados))
@@ -117,7 +156,7 @@ def main():
 
     # 8b) Ingresos cripto (staking, airdrops, intereses)
     st.subheader("🤑 Ingresos cripto (staking, airdrops, intereses)")
-    st.table(df_ingresos.fillna(""))
+    st.table(rellenar_texto(df_ingresos))
 
     total_ingresos = df_ingresos['valor_eur'].sum()
     cuota_irpf_ing = extraer_cuota(calcular_irpf_ingresos(df_ingresos))
@@ -131,7 +170,6 @@ def main():
     excel_io: BytesIO = exportar_excel(df_resultados, df_ingresos)
     # Aseguramos barra al 100%
     progress.progress(1.0)
-    time.sleep(0.1)
 
     st.download_button(
         "📥 Descargar reporte (.xlsx)",
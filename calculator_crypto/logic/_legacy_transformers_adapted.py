@@ -1,5 +1,8 @@
 # logic/_legacy_transformers_adapted.py
 
+from itertools import chain
+
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from .api_pricing import YAHOO_CRYPTO_SYMBOLS  # para obtener las claves conocidas
@@ -7,59 +10,121 @@ from .api_pricing import YAHOO_CRYPTO_SYMBOLS  # para obtener las claves conocid
 # Construimos el set de monedas “USD-like” y de todas las criptos listadas
 KNOWN_CURRENCIES = set(YAHOO_CRYPTO_SYMBOLS.keys()) | {"eur"}
 
-def normalizar_simbolo_cripto_legacy(simbolo_bruto):
+# Sufijos '-usdt', 'usdt', '-usd', 'usd' al final del símbolo; se conserva el grupo 1.
+# El (.+?) exige al menos un carácter delante (equivale a len(s) > len(suf)). Sin
+# lookbehind para que también valga en RE2 (columnas Arrow).
+_SUFIJO_USD_RE = r"(?s)^(.+?)-?usdt?$"
+
+# Monedas que se convierten a EUR con la tasa USD→EUR del día
+USD_LIKE = frozenset({"usd","usdt","usdc","busd","dai","tusd","fdusd"})
+
+# Operaciones Binance que cuentan como ingreso (patrones en texto: Arrow no acepta re.Pattern)
+_OPERACIONES_INGRESO_RE = r"airdrop|reward|interest|staking|mining|distribution"
+
+# Etiquetas Koinly que cuentan como ingreso en un 'receive'
+_ETIQUETAS_INGRESO_RE = r"reward|staking|interest|airdrop|mining|n/a"
+
+def _normalizar_columna_simbolos(col: pd.Series) -> pd.Series:
     """
-    Normaliza el símbolo que viene en el CSV:
+    Normaliza una columna de símbolos del CSV:
      - Pasa a minúsculas y quita espacios.
-     - Si está en KNOWN_CURRENCIES, lo devuelve tal cual.
+     - Si está en KNOWN_CURRENCIES, lo deja tal cual.
      - Si acaba en sufijos típicos '-usdt', 'usdt', '-usd', 'usd', elimina el sufijo.
+    Los valores no válidos (NaN, no-texto o vacíos) quedan como NaN.
+    Una columna vacía entera (float NaN, o null[pyarrow] si se leyó con Arrow) no tiene .str.
     """
-    if pd.isna(simbolo_bruto) or not isinstance(simbolo_bruto, str):
-        return None
-    s = simbolo_bruto.strip().lower()
+    if pd.api.types.is_numeric_dtype(col) or col.isna().all():
+        return pd.Series(np.nan, index=col.index, dtype=object)
+    s = col.str.strip().str.lower()
+    s = s.where(s.isin(KNOWN_CURRENCIES), s.str.replace(_SUFIJO_USD_RE, r"\1", regex=True))
+    return s.mask(s.eq(""))
+
 
-    # Si es exactamente una moneda conocida, mantenla
-    if s in KNOWN_CURRENCIES:
-        return s
+def _columna(df: pd.DataFrame, nombre: str) -> pd.Series:
+    """Devuelve df[nombre] o, si el CSV no trae esa columna, una columna de NaN."""
+    if nombre in df.columns:
+        return df[nombre]
+    return pd.Series(np.nan, index=df.index, dtype=object)
 
-    # Si termina en uno de estos sufijos, límpialo (p.ej. 'pepe-usdt' → 'pepe')
-    for suf in ("-usdt", "usdt", "-usd", "usd"):
-        if s.endswith(suf) and len(s) > len(suf):
-            return s[:-len(suf)]
 
-    # Si no coincide con nada, devolvemos el valor limpio
-    return s or None
+def _importes(col: pd.Series) -> pd.Series:
+    """
+    Columna de importes como float64 (NaN si no es un número).
+    Las columnas Arrow (double[pyarrow]) distinguen NA y NaN; aquí ambos pasan a NaN.
+    """
+    return pd.to_numeric(col, errors='coerce').astype('float64')
 
 
-def _convertir_a_eur_si_necesario(valor, moneda, fecha_obj, fn_obtener_precio, errores, cripto_error=""):
+def _obtener_precios_por_par(pares, fn_obtener_precio, fn_obtener_precios_bulk=None) -> dict:
     """
-    Convierte un importe en una moneda dada a EUR:
-     - Si la moneda es EUR, lo devuelve tal cual.
-     - Si es USD-like, usa fn_obtener_precio('usd', fecha) como tasa.
-     - En caso de error, añade la tupla (moneda, fecha) a errores y devuelve None.
+    Consulta el precio una sola vez por cada par (cripto, fecha) distinto.
+    Si hay fn_obtener_precios_bulk se le pasan todos los pares en una llamada.
+    Devuelve {(cripto, fecha): precio o None}.
     """
-    if valor is None or pd.isna(valor):
-        return None
+    pares = list(dict.fromkeys(pares))
+    if fn_obtener_precios_bulk is not None:
+        return fn_obtener_precios_bulk(pares)
+    return {par: fn_obtener_precio(*par) for par in pares}
 
-    moneda_norm = normalizar_simbolo_cripto_legacy(moneda)
-    if moneda_norm == "eur":
-        return float(valor)
 
-    usd_like = {"usd","usdt","usdc","busd","dai","tusd","fdusd"}
-    if moneda_norm in usd_like:
-        tasa = fn_obtener_precio("usd", fecha_obj)
-        if tasa is not None:
-            return float(valor) * tasa
-        errores.append(("usd", fecha_obj))
-        if cripto_error:
-            errores.append((cripto_error, fecha_obj))
-    return None
+def _precio_por_fila(cripto, fecha, precios) -> pd.Series:
+    """Precio de cada fila según su par (cripto, fecha); NaN si no hay precio."""
+    pares = zip(cripto.to_numpy(), fecha.to_numpy())
+    return pd.Series([precios.get(par) for par in pares], index=cripto.index, dtype=float)
 
 
-def transformar_binance_adaptado(df_raw: pd.DataFrame, fn_obtener_precio):
+def _valorar_a_precio(cripto, cantidad, fecha, precios, errores):
+    """
+    Calcula cantidad * precio(cripto, fecha) para cada fila usando el dict de precios.
+    Las filas sin precio se añaden al set de errores y quedan como NaN.
+    """
+    precio = _precio_por_fila(cripto, fecha, precios)
+    faltan = precio.isna()
+    errores.update(zip(cripto[faltan], fecha[faltan]))
+    return cantidad * precio
+
+
+def _primera_por_grupo(ts, es_op, filas, importe, moneda):
+    """
+    Para cada fila de `filas`, devuelve (importe, moneda) de la primera fila de su
+    mismo utc_time que cumple es_op, o NaN si en ese utc_time no hay ninguna.
+    """
+    primeras = ts[es_op].drop_duplicates()
+    pos = ts[filas].map(pd.Series(primeras.index, index=primeras.to_numpy()))
+    return (pd.Series(importe.reindex(pos).to_numpy(), index=pos.index),
+            pd.Series(moneda.reindex(pos).to_numpy(), index=pos.index, dtype=object))
+
+
+def _tasas_usd(fechas, precios) -> pd.Series:
+    """Serie de tasas USD→EUR indexada por fecha (una entrada por día distinto)."""
+    return pd.Series({f: precios.get(("usd", f)) for f in pd.unique(fechas)}, dtype=float)
+
+
+def _convertir_columna_a_eur(valor, moneda, fecha, tasa_usd, errores, cripto_error=None):
+    """
+    Convierte a EUR una columna de importes en la moneda (ya normalizada) de cada fila:
+     - Si la moneda es EUR, lo devuelve tal cual.
+     - Si es USD-like, lo multiplica por la tasa del día (tasa_usd, ver _tasas_usd).
+     - Si falta la tasa, añade ('usd', fecha) y, si se indica, (cripto_error, fecha) a errores.
+     - El resto de monedas (o importes NaN) quedan como NaN.
+    """
+    tasa = tasa_usd.reindex(fecha.to_numpy()).to_numpy()
+    es_usd = (moneda.isin(USD_LIKE) & valor.notna()).to_numpy()
+    sin_tasa = es_usd & np.isnan(tasa)
+    errores.update(("usd", f) for f in fecha[sin_tasa])
+    if cripto_error is not None:
+        errores.update(zip(cripto_error[sin_tasa], fecha[sin_tasa]))
+    return pd.Series(
+        np.select([moneda.eq("eur").to_numpy(), es_usd], [valor, valor * tasa], default=np.nan),
+        index=valor.index
+    )
+
+
+def transformar_binance_adaptado(df_raw: pd.DataFrame, fn_obtener_precio, fn_obtener_precios_bulk=None):
     """
     Transformador para Binance CSV “Transaction History”.
     Extrae COMPRAS, VENTAS e INGRESOS, convierte todo a EUR.
+    fn_obtener_precios_bulk (opcional) resuelve todos los pares (cripto, fecha) de una vez.
     """
     df = df_raw.copy()
     df.columns = [c.strip().lower() for c in df.columns]
@@ -79,161 +144,113 @@ def transformar_binance_adaptado(df_raw: pd.DataFrame, fn_obtener_precio):
         cols = ['fecha','tipo','cripto','cantidad','valor_eur','fee_eur']
         return pd.DataFrame(columns=cols), []
 
-    procesos = []
-    errores = []
-    processed = set()
-
-    for ts, group in df.groupby('utc_time'):
-        fecha_obj = group['fecha'].iloc[0]
-
-        # VENTAS
-        sold = group[group['operation'].str.lower() == "transaction sold"]
-        if not sold.empty:
-            for _, row in sold.iterrows():
-                idx = row.name
-                if idx in processed: continue
-                processed.add(idx)
-
-                cripto = normalizar_simbolo_cripto_legacy(row['coin'])
-                cantidad = abs(pd.to_numeric(row['change'], errors='coerce'))
-                if not cripto or pd.isna(cantidad) or cantidad <= 0:
-                    continue
-
-                # revenue = valor bruto de venta
-                rev = group[group['operation'].str.lower() == "transaction revenue"]
-                valor_eur = None
-                if not rev.empty:
-                    r = rev.iloc[0]
-                    processed.add(r.name)
-                    valor = pd.to_numeric(r['change'], errors='coerce')
-                    valor_eur = _convertir_a_eur_si_necesario(
-                        valor, r['coin'], fecha_obj, fn_obtener_precio, errores, cripto
-                    )
-
-                # fee
-                fee_eur = 0.0
-                fee_rows = group[group['operation'].str.lower() == "transaction fee"]
-                if not fee_rows.empty:
-                    f = fee_rows.iloc[0]
-                    processed.add(f.name)
-                    amt = abs(pd.to_numeric(f['change'], errors='coerce'))
-                    moneda_fee = normalizar_simbolo_cripto_legacy(f['coin'])
-                    fee_conv = fn_obtener_precio(moneda_fee, fecha_obj)
-                    if fee_conv is not None:
-                        fee_eur = amt * fee_conv
-                    else:
-                        conv = _convertir_a_eur_si_necesario(
-                            amt, f['coin'], fecha_obj, fn_obtener_precio, errores
-                        )
-                        fee_eur = conv or 0.0
-
-                # fallback si valor_eur no calculado
-                if valor_eur is None:
-                    precio_unit = fn_obtener_precio(cripto, fecha_obj)
-                    if precio_unit is not None:
-                        valor_eur = cantidad * precio_unit
-                    else:
-                        errores.append((cripto, fecha_obj))
-
-                procesos.append({
-                    "fecha": fecha_obj, "tipo": "Venta", "cripto": cripto,
-                    "cantidad": cantidad, "valor_eur": valor_eur, "fee_eur": fee_eur
-                })
-            continue
-
-        # COMPRAS
-        buys = group[group['operation'].str.lower() == "transaction buy"]
-        if not buys.empty:
-            for _, row in buys.iterrows():
-                idx = row.name
-                if idx in processed: continue
-                processed.add(idx)
-
-                cripto = normalizar_simbolo_cripto_legacy(row['coin'])
-                cantidad = pd.to_numeric(row['change'], errors='coerce')
-                if not cripto or pd.isna(cantidad) or cantidad <= 0:
-                    continue
-
-                spend = group[group['operation'].str.lower() == "transaction spend"]
-                valor_eur = None
-                if not spend.empty:
-                    s = spend.iloc[0]
-                    processed.add(s.name)
-                    amt = abs(pd.to_numeric(s['change'], errors='coerce'))
-                    valor_eur = _convertir_a_eur_si_necesario(
-                        amt, s['coin'], fecha_obj, fn_obtener_precio, errores, cripto
-                    )
-
-                if valor_eur is None:
-                    precio_unit = fn_obtener_precio(cripto, fecha_obj)
-                    if precio_unit is not None:
-                        valor_eur = cantidad * precio_unit
-                    else:
-                        errores.append((cripto, fecha_obj))
-
-                procesos.append({
-                    "fecha": fecha_obj, "tipo": "Compra", "cripto": cripto,
-                    "cantidad": cantidad, "valor_eur": valor_eur, "fee_eur": 0.0
-                })
-            continue
-
-        # INGRESOS / DONACIONES y otros
-        for _, row in group.iterrows():
-            idx = row.name
-            if idx in processed:
-                continue
-            op = str(row['operation']).lower()
-            cripto = normalizar_simbolo_cripto_legacy(row['coin'])
-            change = pd.to_numeric(row['change'], errors='coerce')
-            processed.add(idx)
-
-            if not cripto or pd.isna(change) or abs(change) <= 0:
-                continue
-
-            tipo = None
-            valor_eur = None
-            fee_eur = 0.0
-
-            if any(x in op for x in ["airdrop","reward","interest","staking","mining","distribution"]):
-                tipo = "Ingreso"
-                precio = fn_obtener_precio(cripto, fecha_obj)
-                if precio is not None:
-                    valor_eur = abs(change) * precio
-                else:
-                    errores.append((cripto, fecha_obj))
-
-            elif op == "deposit":
-                tipo = "Compra"
-                precio = fn_obtener_precio(cripto, fecha_obj)
-                if precio is not None:
-                    valor_eur = change * precio
-                else:
-                    errores.append((cripto, fecha_obj))
-
-            elif op == "withdraw":
-                tipo = "Venta"
-                precio = fn_obtener_precio(cripto, fecha_obj)
-                if precio is not None:
-                    valor_eur = abs(change) * precio
-                else:
-                    errores.append((cripto, fecha_obj))
-
-            if tipo:
-                procesos.append({
-                    "fecha": fecha_obj, "tipo": tipo, "cripto": cripto,
-                    "cantidad": abs(change), "valor_eur": valor_eur, "fee_eur": fee_eur
-                })
-
-    df_out = pd.DataFrame(procesos)
+    df = df.reset_index(drop=True)
+    ts = df['utc_time']
+    fecha = df['fecha']
     cols = ['fecha','tipo','cripto','cantidad','valor_eur','fee_eur']
-    df_out = df_out[cols] if not df_out.empty else pd.DataFrame(columns=cols)
-    return df_out, list({(c,d) for (c,d) in errores})
-
-
-def transformar_koinly_adaptado(df_raw: pd.DataFrame, fn_obtener_precio):
+    errores = set()
+
+    # Normalización de columnas en bloque
+    # 'operation' se pasa a minúsculas una sola vez y como categoría: hay pocos valores
+    # distintos y las comparaciones posteriores se hacen sobre los códigos
+    op = df['operation'].astype(str).str.lower().astype('category')
+    cripto = _normalizar_columna_simbolos(df['coin'])
+    change = _importes(df['change'])
+    valida = cripto.notna() & change.abs().gt(0)
+
+    # Cada utc_time se trata como venta, compra u "otros" (en ese orden de prioridad)
+    es_sold = op.eq("transaction sold")
+    es_buy = op.eq("transaction buy")
+    grupo_venta = es_sold.groupby(ts).transform('any')
+    grupo_compra = es_buy.groupby(ts).transform('any') & ~grupo_venta
+    grupo_otros = ~grupo_venta & ~grupo_compra
+
+    m_venta = es_sold & valida
+    m_compra = es_buy & grupo_compra & valida & change.gt(0)
+    m_otros = grupo_otros & valida
+    fecha_v = fecha[m_venta]
+    rev_val, rev_cur = _primera_por_grupo(ts, op.eq("transaction revenue"), m_venta, change, cripto)
+    fee_val, fee_cur = _primera_por_grupo(ts, op.eq("transaction fee"), m_venta, change.abs(), cripto)
+    spend_val, spend_cur = _primera_por_grupo(ts, op.eq("transaction spend"), m_compra, change.abs(), cripto)
+
+    # Primera tanda de precios: fees, tasas USD y operaciones "otros"
+    con_fee = fee_cur.notna()
+    precios = _obtener_precios_por_par(chain(
+        zip(fee_cur[con_fee], fecha_v[con_fee]),
+        (("usd", f) for f in fecha[m_venta | m_compra]),
+        zip(cripto[m_otros], fecha[m_otros]),
+    ), fn_obtener_precio, fn_obtener_precios_bulk)
+
+    tasa_usd = _tasas_usd(fecha[m_venta | m_compra], precios)
+
+    # VENTAS: valor desde 'transaction revenue' y fee desde 'transaction fee'
+    cantidad_v = change[m_venta].abs()
+    valor_v = _convertir_columna_a_eur(rev_val, rev_cur, fecha_v, tasa_usd, errores, cripto[m_venta])
+    precio_fee = _precio_por_fila(fee_cur, fecha_v, precios)
+    fee_v = fee_val * precio_fee
+    sin_precio_fee = precio_fee.isna()
+    fee_v[sin_precio_fee] = _convertir_columna_a_eur(
+        fee_val[sin_precio_fee], fee_cur[sin_precio_fee], fecha_v[sin_precio_fee],
+        tasa_usd, errores
+    ).fillna(0.0)
+
+    # COMPRAS: valor desde 'transaction spend'
+    cantidad_c = change[m_compra]
+    valor_c = _convertir_columna_a_eur(
+        spend_val, spend_cur, fecha[m_compra], tasa_usd, errores, cripto[m_compra]
+    )
+
+    # Fallback a precio de mercado si no hubo valor calculado
+    sin_v = valor_v.index[valor_v.isna()]
+    sin_c = valor_c.index[valor_c.isna()]
+    precios.update(_obtener_precios_por_par(
+        (par for par in chain(zip(cripto[sin_v], fecha[sin_v]), zip(cripto[sin_c], fecha[sin_c]))
+         if par not in precios),
+        fn_obtener_precio, fn_obtener_precios_bulk
+    ))
+    valor_v[sin_v] = _valorar_a_precio(cripto[sin_v], cantidad_v[sin_v], fecha[sin_v], precios, errores)
+    valor_c[sin_c] = _valorar_a_precio(cripto[sin_c], cantidad_c[sin_c], fecha[sin_c], precios, errores)
+
+    # INGRESOS / DONACIONES y otros
+    op_o = op[m_otros]
+    es_ingreso = op_o.str.contains(_OPERACIONES_INGRESO_RE, na=False)
+    tipo_o = pd.Series(
+        np.select([es_ingreso, op_o.eq("deposit"), op_o.eq("withdraw")],
+                  ["Ingreso", "Compra", "Venta"], default=""),
+        index=op_o.index
+    )
+    con_tipo = tipo_o.index[tipo_o.ne("")]
+    cantidad_o = change[con_tipo]
+    # Los depósitos se valoran con el signo original del importe
+    importe_o = cantidad_o.where(tipo_o[con_tipo].eq("Compra"), cantidad_o.abs())
+    valor_o = _valorar_a_precio(cripto[con_tipo], importe_o, fecha[con_tipo], precios, errores)
+
+    partes = [
+        pd.DataFrame({"fecha": fecha[m_venta], "tipo": "Venta", "cripto": cripto[m_venta],
+                      "cantidad": cantidad_v, "valor_eur": valor_v, "fee_eur": fee_v}, columns=cols),
+        pd.DataFrame({"fecha": fecha[m_compra], "tipo": "Compra", "cripto": cripto[m_compra],
+                      "cantidad": cantidad_c, "valor_eur": valor_c, "fee_eur": 0.0}, columns=cols),
+        pd.DataFrame({"fecha": fecha[con_tipo], "tipo": tipo_o[con_tipo], "cripto": cripto[con_tipo],
+                      "cantidad": cantidad_o.abs(), "valor_eur": valor_o, "fee_eur": 0.0}, columns=cols),
+    ]
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=cols), list(errores)
+
+    # Mismo orden que el recorrido por utc_time: por timestamp y, dentro, por fila
+    df_out = pd.concat(partes).sort_index(kind='mergesort')
+    df_out = df_out.assign(_ts=ts).sort_values('_ts', kind='mergesort')
+    df_out = df_out[cols].reset_index(drop=True)
+    # tipo/cripto tienen muy pocos valores distintos; los importes siguen en float64
+    df_out = df_out.astype({'tipo': 'category', 'cripto': 'category'})
+    return df_out, list(errores)
+
+
+def transformar_koinly_adaptado(df_raw: pd.DataFrame, fn_obtener_precio, fn_obtener_precios_bulk=None):
     """
     Transformador para Koinly CSV.
     Extrae INGRESOS y TRADES (Compra/Venta), convierte todo a EUR.
+    fn_obtener_precios_bulk (opcional) resuelve todos los pares (cripto, fecha) de una vez.
     """
     df = df_raw.copy()
     df.columns = [c.strip().lower() for c in df.columns]
@@ -251,91 +268,98 @@ def transformar_koinly_adaptado(df_raw: pd.DataFrame, fn_obtener_precio):
         cols = ['fecha','tipo','cripto','cantidad','valor_eur','fee_eur']
         return pd.DataFrame(columns=cols), []
 
-    procesos = []
-    errores = []
-
-    for _, row in df.iterrows():
-        tipo_koinly = str(row.get('type','')).lower()
-        label = str(row.get('label','')).lower()
-        fecha = row['fecha']
-
-        sent_amt = pd.to_numeric(row.get('sent amount'), errors='coerce')
-        sent_cur = normalizar_simbolo_cripto_legacy(row.get('sent currency'))
-        recv_amt = pd.to_numeric(row.get('received amount'), errors='coerce')
-        recv_cur = normalizar_simbolo_cripto_legacy(row.get('received currency'))
-        fee_amt = pd.to_numeric(row.get('fee amount'), errors='coerce')
-        fee_cur = normalizar_simbolo_cripto_legacy(row.get('fee currency'))
-
-        # Fee
-        fee_eur = 0.0
-        if pd.notna(fee_amt) and fee_amt > 0 and fee_cur:
-            precio_fee = fn_obtener_precio(fee_cur, fecha)
-            if precio_fee is not None:
-                fee_eur = fee_amt * precio_fee
-            else:
-                conv = _convertir_a_eur_si_necesario(fee_amt, fee_cur, fecha, fn_obtener_precio, errores)
-                fee_eur = conv or 0.0
-
-        # INGRESOS
-        if tipo_koinly == "receive" and any(x in label for x in ("reward","staking","interest","airdrop","mining","n/a")):
-            if recv_cur and pd.notna(recv_amt) and recv_amt > 0:
-                precio = fn_obtener_precio(recv_cur, fecha)
-                if precio is not None:
-                    valor = recv_amt * precio
-                    procesos.append({
-                        "fecha": fecha, "tipo": "Ingreso", "cripto": recv_cur,
-                        "cantidad": recv_amt, "valor_eur": valor, "fee_eur": fee_eur
-                    })
-                else:
-                    errores.append((recv_cur, fecha))
-
-        # TRADES
-        if tipo_koinly == "trade":
-            # Venta
-            if pd.notna(sent_amt) and sent_amt > 0 and sent_cur:
-                precio = fn_obtener_precio(sent_cur, fecha)
-                valor = sent_amt * precio if precio is not None else None
-                if valor is not None:
-                    procesos.append({
-                        "fecha": fecha, "tipo": "Venta", "cripto": sent_cur,
-                        "cantidad": sent_amt, "valor_eur": valor, "fee_eur": fee_eur
-                    })
-                else:
-                    errores.append((sent_cur, fecha))
-            # Compra
-            if pd.notna(recv_amt) and recv_amt > 0 and recv_cur:
-                precio = fn_obtener_precio(recv_cur, fecha)
-                valor = recv_amt * precio if precio is not None else None
-                if valor is not None:
-                    procesos.append({
-                        "fecha": fecha, "tipo": "Compra", "cripto": recv_cur,
-                        "cantidad": recv_amt, "valor_eur": valor, "fee_eur": 0.0
-                    })
-                else:
-                    errores.append((recv_cur, fecha))
-
+    df = df.reset_index(drop=True)
+    fecha = df['fecha']
     cols = ['fecha','tipo','cripto','cantidad','valor_eur','fee_eur']
-    df_out = pd.DataFrame(procesos)
-    if not df_out.empty:
-        df_out = df_out[cols]
-    else:
-        df_out = pd.DataFrame(columns=cols)
-    return df_out, list({(c,d) for (c,d) in errores})
-
-
-def transformar_coinbase_placeholder_adaptado(df_raw, fn_obtener_precio):
+    errores = set()
+
+    # Normalización de columnas en bloque (una pasada por columna)
+    # type/label como categorías: los eq y la regex de etiquetas se evalúan
+    # sobre los pocos valores distintos, no fila a fila
+    tipo_koinly = _columna(df, 'type').astype(str).str.lower().astype('category')
+    label = _columna(df, 'label').astype(str).str.lower().astype('category')
+    sent_amt = _importes(_columna(df, 'sent amount'))
+    sent_cur = _normalizar_columna_simbolos(_columna(df, 'sent currency'))
+    recv_amt = _importes(_columna(df, 'received amount'))
+    recv_cur = _normalizar_columna_simbolos(_columna(df, 'received currency'))
+    fee_amt = _importes(_columna(df, 'fee amount'))
+    fee_cur = _normalizar_columna_simbolos(_columna(df, 'fee currency'))
+
+    con_fee = fee_amt.gt(0) & fee_cur.notna()
+    es_ingreso = (
+        tipo_koinly.eq("receive")
+        & label.str.contains(_ETIQUETAS_INGRESO_RE, na=False)
+        & recv_cur.notna() & recv_amt.gt(0)
+    )
+    # Un trade puede dar a la vez una Venta y una Compra en la misma fila
+    es_trade = tipo_koinly.eq("trade")
+    es_venta = es_trade & sent_cur.notna() & sent_amt.gt(0)
+    es_compra = es_trade & recv_cur.notna() & recv_amt.gt(0)
+
+    # Una sola consulta por par (cripto, fecha) distinto
+    recv_valorado = es_ingreso | es_compra
+    precios = _obtener_precios_por_par(chain(
+        zip(fee_cur[con_fee], fecha[con_fee]),
+        zip(recv_cur[recv_valorado], fecha[recv_valorado]),
+        zip(sent_cur[es_venta], fecha[es_venta]),
+    ), fn_obtener_precio, fn_obtener_precios_bulk)
+
+    # Fee: precio directo de la moneda y, si no hay, conversión EUR / USD-like
+    fee_eur = pd.Series(0.0, index=df.index)
+    fee_eur[con_fee] = _valorar_a_precio(
+        fee_cur[con_fee], fee_amt[con_fee], fecha[con_fee], precios, set()
+    )
+    sin_precio_fee = con_fee & fee_eur.isna()
+    if sin_precio_fee.any():
+        necesita_usd = sin_precio_fee & fee_cur.isin(USD_LIKE)
+        precios.update(_obtener_precios_por_par(
+            (("usd", f) for f in fecha[necesita_usd] if ("usd", f) not in precios),
+            fn_obtener_precio, fn_obtener_precios_bulk
+        ))
+        fee_eur[sin_precio_fee] = _convertir_columna_a_eur(
+            fee_amt[sin_precio_fee], fee_cur[sin_precio_fee], fecha[sin_precio_fee],
+            _tasas_usd(fecha[necesita_usd], precios), errores
+        ).fillna(0.0)
+
+    # INGRESOS y TRADES (Venta / Compra); el orden de la lista fija el orden por fila
+    partes = []
+    sin_fee = pd.Series(0.0, index=df.index)
+    for tipo, mascara, cripto, cantidad, fees in (
+        ("Ingreso", es_ingreso, recv_cur, recv_amt, fee_eur),
+        ("Venta", es_venta, sent_cur, sent_amt, fee_eur),
+        ("Compra", es_compra, recv_cur, recv_amt, sin_fee),
+    ):
+        valor = _valorar_a_precio(
+            cripto[mascara], cantidad[mascara], fecha[mascara], precios, errores
+        )
+        ok = valor.index[valor.notna()]
+        if len(ok):
+            partes.append(pd.DataFrame({
+                "fecha": fecha[ok], "tipo": tipo, "cripto": cripto[ok],
+                "cantidad": cantidad[ok], "valor_eur": valor[ok], "fee_eur": fees[ok]
+            }, columns=cols))
+
+    if not partes:
+        return pd.DataFrame(columns=cols), list(errores)
+    df_out = pd.concat(partes).sort_index(kind='mergesort').reset_index(drop=True)
+    # tipo/cripto tienen muy pocos valores distintos; los importes siguen en float64
+    df_out = df_out.astype({'tipo': 'category', 'cripto': 'category'})
+    return df_out, list(errores)
+
+
+def transformar_coinbase_placeholder_adaptado(df_raw, fn_obtener_precio, fn_obtener_precios_bulk=None):
     print("ADVERTENCIA: Transformador Coinbase no implementado todavía.")
     cols = ['fecha','tipo','cripto','cantidad','valor_eur','fee_eur']
     return pd.DataFrame(columns=cols), []
 
 
-def transformar_kraken_placeholder_adaptado(df_raw, fn_obtener_precio):
+def transformar_kraken_placeholder_adaptado(df_raw, fn_obtener_precio, fn_obtener_precios_bulk=None):
     print("ADVERTENCIA: Transformador Kraken no implementado todavía.")
     cols = ['fecha','tipo','cripto','cantidad','valor_eur','fee_eur']
     return pd.DataFrame(columns=cols), []
 
 
-def transformar_kucoin_placeholder_adaptado(df_raw, fn_obtener_precio):
+def transformar_kucoin_placeholder_adaptado(df_raw, fn_obtener_precio, fn_obtener_precios_bulk=None):
     print("ADVERTENCIA: Transformador KuCoin no implementado todavía.")
     cols = ['fecha','tipo','cripto','cantidad','valor_eur','fee_eur']
     return pd.DataFrame(columns=cols), []
@@ -1,4 +1,6 @@
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 import pandas as pd
 import yfinance as yf
@@ -156,6 +158,14 @@ YAHOO_CRYPTO_SYMBOLS = {
 # --- CACHÉS ---
 _yf_price_cache: dict[str, dict[datetime.date, float | None]] = {}
 _yf_fx_cache:    dict[datetime.date, float] = {}
+# Un lock por ticker: si dos hilos (p.ej. dos CSVs subidos) piden el mismo ticker,
+# el segundo espera y lo encuentra en la caché en vez de descargarlo otra vez
+_yf_locks:       dict[str, threading.Lock] = {}
+# Fechas ya pedidas en bloque por ticker (aunque Yahoo no devolviera cierre)
+_yf_precargadas: dict[str, set[datetime.date]] = {}
+
+def _lock_ticker(ticker: str) -> threading.Lock:
+    return _yf_locks.setdefault(ticker, threading.Lock())
 
 def normalizar_simbolo_app(simbolo: str) -> str | None:
     if not isinstance(simbolo, str):
@@ -167,6 +177,10 @@ def normalizar_simbolo_app(simbolo: str) -> str | None:
     return s or None
 
 def _get_yf_crypto_price_usd(ticker: str, fecha: datetime.date) -> float | None:
+    with _lock_ticker(ticker):
+        return _get_yf_crypto_price_usd_sin_lock(ticker, fecha)
+
+def _get_yf_crypto_price_usd_sin_lock(ticker: str, fecha: datetime.date) -> float | None:
     cache = _yf_price_cache.setdefault(ticker, {})
     if fecha in cache:
         return cache[fecha]
@@ -195,6 +209,38 @@ def _get_yf_crypto_price_usd(ticker: str, fecha: datetime.date) -> float | None:
     cache[fecha] = precio
     return precio
 
+def _precargar_ticker(ticker: str, fechas) -> None:
+    """
+    Descarga en una sola llamada el histórico diario de `ticker` que cubre todas
+    las fechas pedidas y lo guarda en la caché. Las fechas sin cierre se dejan sin
+    cachear para que _get_yf_crypto_price_usd aplique su fallback de 7 días.
+    """
+    with _lock_ticker(ticker):
+        _precargar_ticker_sin_lock(ticker, fechas)
+
+def _precargar_ticker_sin_lock(ticker: str, fechas) -> None:
+    cache = _yf_price_cache.setdefault(ticker, {})
+    precargadas = _yf_precargadas.setdefault(ticker, set())
+    pendientes = [f for f in fechas if f not in cache and f not in precargadas]
+    if not pendientes:
+        return
+    precargadas.update(pendientes)
+    try:
+        df = yf.Ticker(ticker).history(
+            start=min(pendientes).isoformat(),
+            end=(max(pendientes) + datetime.timedelta(days=1)).isoformat(),
+            interval="1d"
+        )
+    except Exception:
+        return
+    if df.empty:
+        return
+    cierres = df["Close"].dropna()
+    por_dia = dict(zip(cierres.index.date, cierres.astype(float)))
+    for f in pendientes:
+        if f in por_dia:
+            cache[f] = por_dia[f]
+
 def _get_usd_to_eur_rate(fecha: datetime.date) -> float | None:
     # primero tabla 2024
     if fecha in PREDEFINED_USD_TO_EUR_RATES_FOR_CONVERSION:
@@ -247,4 +293,26 @@ def obtener_precio_historico_eur(raw_symbol: str, fecha: datetime.date) -> float
     if tasa is None:
         return None
 
-    return round(precio_usd * tasa, 8)
\ No newline at end of file
+    return round(precio_usd * tasa, 8)
+
+def obtener_precios_historicos_eur(pares, max_workers: int = 8) -> dict:
+    """
+    Versión por lotes de obtener_precio_historico_eur.
+    Agrupa los pares (símbolo, fecha) distintos por ticker, descarga cada ticker
+    una sola vez (varios tickers en paralelo) y devuelve {(símbolo, fecha): precio}.
+    """
+    pares = list(dict.fromkeys(pares))
+
+    fechas_por_ticker: dict[str, set] = {}
+    for raw_symbol, fecha in pares:
+        sym = normalizar_simbolo_app(raw_symbol)
+        if sym and sym not in ("usd", "eur"):
+            ticker = YAHOO_CRYPTO_SYMBOLS.get(sym, f"{sym.upper()}-USD")
+            fechas_por_ticker.setdefault(ticker, set()).add(fecha)
+
+    if fechas_por_ticker:
+        workers = min(max_workers, len(fechas_por_ticker))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(_precargar_ticker, fechas_por_ticker.keys(), fechas_por_ticker.values()))
+
+    return {par: obtener_precio_historico_eur(*par) for par in pares}
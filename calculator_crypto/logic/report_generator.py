@@ -3,7 +3,14 @@
 import pandas as pd
 from io import BytesIO
 import xlsxwriter
-from datetime import datetime
+
+def _anchos_columnas(df: pd.DataFrame, muestra: int = 200) -> list:
+    """
+    Ancho de cada columna: el texto más largo (o la cabecera) + 2.
+    Se estima con una muestra de filas; es cosmético y no merece recorrer todo.
+    """
+    longitudes = df.head(muestra).astype(str).apply(lambda s: s.str.len().max()).fillna(0)
+    return [max(int(n), len(c)) + 2 for c, n in zip(df.columns, longitudes)]
 
 def exportar_excel(df_resultados: pd.DataFrame, df_ingresos: pd.DataFrame = None) -> BytesIO:
     output = BytesIO()
@@ -20,7 +27,10 @@ def exportar_excel(df_resultados: pd.DataFrame, df_ingresos: pd.DataFrame = None
         else 0.0
     )
 
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+    # Sin constant_memory: pandas escribe las celdas por columnas y xlsxwriter,
+    # en ese modo, descarta todo lo que no sea la fila actual.
+    with pd.ExcelWriter(output, engine='xlsxwriter',
+                        engine_kwargs={'options': {'strings_to_urls': False}}) as writer:
         workbook  = writer.book
 
         # --- Formatos comunes ---
@@ -44,21 +54,9 @@ def exportar_excel(df_resultados: pd.DataFrame, df_ingresos: pd.DataFrame = None
             ]
             available_cols = [c for c in desired_cols if c in df_resultados.columns]
             df_g = df_resultados[available_cols].copy()
-            # Seleccionar solo las columnas disponibles, en el orden ideal
-            desired_cols = [
-                "fecha", "cripto", "cantidad_vendida",
-                "precio_unitario_compra_eur", "precio_unitario_venta_eur",
-                "ganancia_perdida_eur"
-            ]
-            available_cols = [c for c in desired_cols if c in df_resultados.columns]
-            df_g = df_resultados[available_cols].copy()
-
 
-            # Convertir fecha si viene como string
-            df_g['fecha'] = df_g['fecha'].apply(
-                lambda d: datetime.strptime(d, '%Y-%m-%d').date() if isinstance(d, str)
-                          else (d.date() if hasattr(d, 'date') else d)
-            )
+            # Fecha como date (acepta strings, Timestamps o date)
+            df_g['fecha'] = pd.to_datetime(df_g['fecha'], errors='coerce').dt.date
 
             df_g.to_excel(writer, sheet_name=sheet_gan, index=False,
                           startrow=1, header=False, na_rep="")
@@ -68,9 +66,7 @@ def exportar_excel(df_resultados: pd.DataFrame, df_ingresos: pd.DataFrame = None
             for col, name in enumerate(df_g.columns):
                 ws.write(0, col, name, header_fmt)
             # Ancho y formatos
-            for col, name in enumerate(df_g.columns):
-                col_data = df_g[name]
-                max_len = max(col_data.astype(str).map(len).max(), len(name)) + 2
+            for col, (name, max_len) in enumerate(zip(df_g.columns, _anchos_columnas(df_g))):
                 if 'fecha' in name.lower():
                     ws.set_column(col, col, max(max_len, 12), date_fmt)
                 elif 'valor' in name.lower() or 'fee' in name.lower() or 'ganancia' in name.lower():
@@ -95,10 +91,7 @@ def exportar_excel(df_resultados: pd.DataFrame, df_ingresos: pd.DataFrame = None
             df_i = df_ingresos[[
                 "fecha", "tipo", "cripto", "cantidad", "valor_eur", "fee_eur"
             ]].copy()
-            df_i['fecha'] = df_i['fecha'].apply(
-                lambda d: datetime.strptime(d, '%Y-%m-%d').date() if isinstance(d, str)
-                          else (d.date() if hasattr(d, 'date') else d)
-            )
+            df_i['fecha'] = pd.to_datetime(df_i['fecha'], errors='coerce').dt.date
 
             df_i.to_excel(writer, sheet_name=sheet_ing, index=False,
                           startrow=1, header=False, na_rep="")
@@ -106,9 +99,7 @@ def exportar_excel(df_resultados: pd.DataFrame, df_ingresos: pd.DataFrame = None
             ws2 = writer.sheets[sheet_ing]
             for col, name in enumerate(df_i.columns):
                 ws2.write(0, col, name, header_fmt)
-            for col, name in enumerate(df_i.columns):
-                col_data = df_i[name]
-                max_len = max(col_data.astype(str).map(len).max(), len(name)) + 2
+            for col, (name, max_len) in enumerate(zip(df_i.columns, _anchos_columnas(df_i))):
                 if 'fecha' in name.lower():
                     ws2.set_column(col, col, max(max_len, 12), date_fmt)
                 elif 'valor_eur' in name.lower() or 'fee_eur' in name.lower():
@@ -1,115 +1,257 @@
 # logic/tax_calculator.py
 
+import numpy as np
 import pandas as pd
-from collections import deque
 from datetime import timedelta
 
-def calcular_fifo(df_operaciones: pd.DataFrame) -> pd.DataFrame:
+try:
+    from numba import njit
+except ImportError:  # numba es opcional: sin él los kernels corren en Python puro
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+try:
+    import numexpr as ne
+except ImportError:  # numexpr es opcional: sin él los cálculos por lotes usan NumPy
+    ne = None
+
+
+# Código entero de cada tipo que interviene en el FIFO (posición en el índice);
+# el resto de tipos (Ingreso, ...) queda como -1
+TIPOS_FIFO = pd.Index(["Compra", "Venta", "Donacion"])
+COMPRA = 0
+
+# Columnas que usa calcular_fifo y valor por defecto de las que pueden faltar
+COLUMNAS_FIFO = ['fecha', 'tipo', 'cripto', 'cantidad', 'valor_eur', 'fee_eur']
+DEFECTOS_FIFO = {'cantidad': 0.0, 'valor_eur': 0.0, 'fee_eur': 0.0}
+
+
+@njit(cache=True)
+def _consumir_lotes(cantidades, costes, fines, necesarios):
+    """
+    Recorre en orden FIFO todas las ventas de una cripto en una sola llamada.
+    La venta v consume los lotes [inicio, fines[v]) hasta cubrir necesarios[v];
+    lo extraído se resta en su sitio de `cantidades` y los lotes agotados
+    (<= 1e-9) ya no se vuelven a tocar.
+    Devuelve (coste_adq, restante, lote, tomado, limites): por venta, su coste y lo
+    que quedó sin cubrir; los lotes tocados por la venta v y lo tomado de cada uno
+    son lote[limites[v]:limites[v+1]] y tomado[limites[v]:limites[v+1]].
+    """
+    n = len(necesarios)
+    coste_adq = np.zeros(n)
+    restantes = np.empty(n)
+    limites = np.zeros(n + 1, dtype=np.int64)
+    # Cada venta toca a lo sumo un lote sin agotarlo: n + len(lotes) basta
+    lote = np.empty(n + len(cantidades), dtype=np.int64)
+    tomado = np.empty(n + len(cantidades))
+    inicio = 0
+    k = 0
+    for v in range(n):
+        restante = necesarios[v]
+        coste = 0.0
+        i = inicio
+        while restante > 0 and i < fines[v]:
+            t = min(restante, cantidades[i])
+            coste += t * costes[i]
+            lote[k] = i
+            tomado[k] = t
+            k += 1
+            cantidades[i] -= t
+            restante -= t
+            if cantidades[i] <= 1e-9:
+                i += 1
+        inicio = i
+        coste_adq[v] = coste
+        restantes[v] = restante
+        limites[v + 1] = k
+    return coste_adq, restantes, lote, tomado, limites
+
+
+def calcular_fifo(df_operaciones: pd.DataFrame, *, incluir_lotes_origen: bool = True) -> pd.DataFrame:
     """
     Calcula las ganancias/pérdidas patrimoniales usando FIFO para cada cripto.
     Columnas de entrada:
       - fecha (date o convertible)
       - tipo: "Compra", "Venta", "Donacion", "Ingreso"
       - cripto: str
-      - cantidad: float
-      - valor_eur: float (coste o valor de mercado)
-      - fee_eur: float (opcional)
+      - cantidad: float (opcional, 0.0)
+      - valor_eur: float (coste o valor de mercado; opcional, 0.0)
+      - fee_eur: float (opcional, 0.0)
     Devuelve DataFrame con:
       ['fecha_venta','cripto','tipo_operacion','cantidad_vendida',
        'valor_transmision_neto_eur','coste_adquisicion_total_eur',
        'ganancia_perdida_eur',…]
+    Con incluir_lotes_origen=False no se genera 'lotes_origen_info' (el texto
+    cantidad@fecha@coste de cada lote), que es lo más caro del cálculo.
     """
-    df = df_operaciones.copy()
-    df['fecha'] = pd.to_datetime(df['fecha']).dt.date
-    df = df.sort_values('fecha')
-
-    colas: dict[str, deque] = {}
-    ventas = []
-
-    for _, f in df.iterrows():
-        tipo = f['tipo']
-        cripto = str(f['cripto']).lower()
-        cantidad = float(f['cantidad'])
-        valor = float(f['valor_eur'])
-        fee   = float(f.get('fee_eur', 0.0))
-        fecha = f['fecha']
-
-        if cantidad <= 0 or not cripto:
-            continue
+    # Esquema fijo: solo se copian las columnas del FIFO y se completan las que falten
+    df = df_operaciones[[c for c in COLUMNAS_FIFO if c in df_operaciones.columns]].copy()
+    for col, defecto in DEFECTOS_FIFO.items():
+        if col not in df.columns:
+            df[col] = defecto
+
+    # Tipos fijados una vez por columna
+    importes = ['cantidad', 'valor_eur', 'fee_eur']
+    df[importes] = df[importes].astype('float64')
+    df['tipo_cod'] = TIPOS_FIFO.get_indexer(df['tipo']).astype('int8')
+
+    # Un único filtro vectorial antes de ordenar: solo compras/ventas/donaciones
+    # con cantidad y cripto (Ingreso, polvo y filas vacías no llegan al bucle).
+    # En columnas Arrow ne('') da NA para los cripto nulos: se conservan (van a 'nan')
+    con_cripto = df['cripto'].ne('').fillna(True).astype(bool)
+    df = df[(df['tipo_cod'] >= 0) & ~(df['cantidad'] <= 0) & con_cripto]
+
+    # Fechas como datetime64 (orden sobre int64); mergesort es estable y mantiene
+    # el orden de entrada de las operaciones del mismo día
+    df = df.assign(fecha=pd.to_datetime(df['fecha'], errors='coerce'))
+    df = df.sort_values('fecha', kind='mergesort')
+
+    # Los cripto nulos quedan como 'nan', igual que con str(NaN); como categoría
+    # el groupby agrupa por los códigos enteros
+    df['cripto'] = df['cripto'].astype(str).str.lower().fillna('nan').astype('category')
+
+    # Ventas/donaciones que salen en el resultado, en orden cronológico
+    es_salida = (df['tipo_cod'] != COMPRA).to_numpy()
+    n_ventas = int(es_salida.sum())
+    # orden: posición cronológica (para localizar los lotes previos a cada venta);
+    # fila: fila de salida de cada venta, conocida de antemano;
+    # dia: fecha como entero (días desde 1970, NaT incluido) para los lotes
+    df = df.assign(
+        orden=np.arange(len(df)),
+        fila=np.cumsum(es_salida) - 1,
+        dia=df['fecha'].to_numpy(dtype='datetime64[D]').view('int64'),
+    )
+    coste_adq = np.zeros(n_ventas)
+    notas = [""] * n_ventas
+    lotes_origen = ["N/A"] * n_ventas
+
+    # Cada cripto se procesa entera y seguida (groupby mantiene el orden por fecha)
+    for cripto, sub in df.groupby('cripto', observed=True, sort=False):
+        es_compra = (sub['tipo_cod'] == COMPRA).to_numpy()
 
-        if cripto not in colas:
-            colas[cripto] = deque()
-
-        # Registro de compra: añadimos lote
-        if tipo == "Compra":
-            coste_total = valor + fee
-            coste_unit = coste_total / cantidad if cantidad else 0.0
-            colas[cripto].append({
-                'cantidad_disponible': cantidad,
-                'coste_unit': coste_unit,
-                'fecha_compra': fecha
-            })
+        # Lotes como arrays paralelos (cantidad, coste unitario, día) para el kernel
+        compras = sub[es_compra]
+        cantidades = compras['cantidad'].to_numpy(dtype='float64', copy=True)
+        costes = ((compras['valor_eur'] + compras['fee_eur']) / compras['cantidad']).to_numpy()
+        dias = compras['dia'].to_numpy()
+
+        # Venta o Donacion: consumimos FIFO los lotes comprados antes de cada una
+        salidas = sub[~es_compra]
+        if salidas.empty:
             continue
+        fines = np.searchsorted(compras['orden'].to_numpy(), salidas['orden'].to_numpy())
+        coste, restantes, lote, tomado, limites = _consumir_lotes(
+            cantidades, costes, fines, salidas['cantidad'].to_numpy()
+        )
+        filas = salidas['fila'].to_numpy()
+        coste_adq[filas] = coste
+
+        # Textos de lotes y notas: fuera del kernel, solo donde hace falta
+        if incluir_lotes_origen:
+            # Texto de la fecha de cada lote, formateado de una vez
+            fechas = np.datetime_as_string(dias.view('datetime64[D]'), unit='D')
+            for v, fila in enumerate(filas):
+                desde, hasta = limites[v], limites[v + 1]
+                if hasta > desde:
+                    lotes_origen[fila] = "; ".join(
+                        f"{tomado[k]:.8f}@{fechas[lote[k]]}@{costes[lote[k]]:.2f}"
+                        for k in range(desde, hasta)
+                    )
+        sin_cubrir = restantes > 1e-9
+        for fila, restante in zip(filas[sin_cubrir], restantes[sin_cubrir]):
+            notas[fila] = f"Sin histórico para {restante:.8f} {cripto}"
+
+    # Resultado por columnas: lo que no depende de los lotes sale tal cual de df
+    ventas = df[es_salida]
+    valor = ventas['valor_eur'].to_numpy()
+    fee = ventas['fee_eur'].to_numpy()
+    valor_neto = valor - fee
+    df_ventas = pd.DataFrame({
+        'fecha_venta': ventas['fecha'].dt.date.to_numpy(),
+        'cripto': ventas['cripto'].astype(str).to_numpy(),
+        'tipo_operacion': ventas['tipo'].astype(str).to_numpy(),
+        'cantidad_vendida': ventas['cantidad'].to_numpy(),
+        'valor_transmision_bruto_eur': valor,
+        'comision_venta_eur': fee,
+        'valor_transmision_neto_eur': valor_neto,
+        'coste_adquisicion_total_eur': coste_adq,
+        'ganancia_perdida_eur': valor_neto - coste_adq,
+        'nota': notas,
+    })
+    if incluir_lotes_origen:
+        df_ventas['lotes_origen_info'] = lotes_origen
+    return df_ventas
+
 
-        # Venta o Donacion: consumimos FIFO
-        if tipo in ("Venta", "Donacion"):
-            valor_neto = valor - fee
-            restante  = cantidad
-            coste_adq  = 0.0
-            lotes_info = []
-
-            while restante > 0 and colas[cripto]:
-                lote = colas[cripto][0]
-                tomados = min(restante, lote['cantidad_disponible'])
-                coste_adq += tomados * lote['coste_unit']
-                lotes_info.append(f"{tomados:.8f}@{lote['fecha_compra']}@{lote['coste_unit']:.2f}")
-                lote['cantidad_disponible'] -= tomados
-                restante -= tomados
-                if lote['cantidad_disponible'] <= 1e-9:
-                    colas[cripto].popleft()
-
-            nota = ""
-            if restante > 1e-9:
-                nota = f"Sin histórico para {restante:.8f} {cripto}"
-                restante = 0.0
-
-            ganancia = valor_neto - coste_adq
-
-            ventas.append({
-                'fecha_venta': fecha,
-                'cripto': cripto,
-                'tipo_operacion': tipo,
-                'cantidad_vendida': cantidad,
-                'valor_transmision_bruto_eur': valor,
-                'comision_venta_eur': fee,
-                'valor_transmision_neto_eur': valor_neto,
-                'coste_adquisicion_total_eur': coste_adq,
-                'ganancia_perdida_eur': ganancia,
-                'nota': nota,
-                'lotes_origen_info': "; ".join(lotes_info) or "N/A"
-            })
-
-    return pd.DataFrame(ventas)
+TIPO_INGRESOS = 0.19  # Tipo fijo para rendimientos (ajústalo si cambia)
+
+# Resultado del caso sin ingresos, construido una sola vez (se devuelven copias)
+_SIN_INGRESOS = pd.DataFrame({'total_ingresos_eur': [0.0], 'irpf_ingresos_eur': [0.0]})
+
+
+def cuota_irpf_ingresos(totales, tipo: float = TIPO_INGRESOS):
+    """
+    Cuota de IRPF de ingresos, redondeada a céntimos, para un total o un array de totales.
+    """
+    return np.round(np.asarray(totales, dtype='float64') * tipo, 2)
 
 
 def calcular_irpf_ingresos(df_ingresos: pd.DataFrame) -> pd.DataFrame:
     """
     Calcula el IRPF estimado para ingresos (rendimientos del capital mobiliario).
-    - Suma todos los 'valor_eur' y aplica un tipo fijo (p.ej. 19%).
+    - Suma todos los 'valor_eur' y aplica un tipo fijo (TIPO_INGRESOS).
     Devuelve DataFrame:
       ['total_ingresos_eur','irpf_ingresos_eur']
     """
     if df_ingresos.empty or 'valor_eur' not in df_ingresos.columns:
-        return pd.DataFrame([{'total_ingresos_eur': 0.0, 'irpf_ingresos_eur': 0.0}])
+        return _SIN_INGRESOS.copy()
 
     total = df_ingresos['valor_eur'].sum()
-    tipo = 0.19  # Tipo fijo para rendimientos (ajústalo si cambia)
     return pd.DataFrame([{
         'total_ingresos_eur': total,
-        'irpf_ingresos_eur': round(total * tipo, 2)
+        'irpf_ingresos_eur': float(cuota_irpf_ingresos(total))
     }])
 
 
+# Tramos de la base del ahorro: inicio, ancho y tipo de cada uno
+TRAMOS_INICIO = np.array([0.0, 6000.0, 50000.0, 200000.0])
+TRAMOS_ANCHO = np.array([6000.0, 50000.0 - 6000.0, 200000.0 - 50000.0, np.inf])
+TRAMOS_TIPO = np.array([0.19, 0.21, 0.23, 0.26])
+# Cuota acumulada al inicio de cada tramo (los anteriores, completos)
+TRAMOS_CUOTA = np.concatenate(([0.0], np.cumsum(TRAMOS_ANCHO[:-1] * TRAMOS_TIPO[:-1])))
+
+# Misma cuenta desplegada tramo a tramo para numexpr, que la evalúa en una sola
+# pasada por bloques sin materializar la matriz (N, 4)
+_EXPR_TRAMOS = " + ".join(
+    f"t{k} * where(x - i{k} > a{k}, a{k}, where(x - i{k} <= 0, 0, x - i{k}))"
+    for k in range(len(TRAMOS_TIPO))
+)
+_CONST_TRAMOS = {
+    f"{nombre}{k}": valor
+    for nombre, valores in (("i", TRAMOS_INICIO), ("a", TRAMOS_ANCHO), ("t", TRAMOS_TIPO))
+    for k, valor in enumerate(valores)
+}
+_MIN_NUMEXPR = 1 << 16  # por debajo, el arranque de numexpr no compensa
+
+
+def cuota_irpf_ganancias(bases):
+    """
+    Cuota de IRPF (sin redondear) para una base o un array 1-D de bases.
+    - Se busca el tramo de la base con searchsorted y se suma a la cuota
+      acumulada hasta su inicio lo que cae dentro: cuota + tipo * (base - inicio).
+    - Las bases negativas tributan 0; un NaN sigue siendo NaN.
+    - Con arrays grandes y numexpr disponible, se evalúa fusionado con numexpr.
+    """
+    bases = np.asarray(bases, dtype='float64')
+    if ne is not None and bases.ndim == 1 and len(bases) >= _MIN_NUMEXPR:
+        return ne.evaluate(_EXPR_TRAMOS, local_dict={'x': bases, **_CONST_TRAMOS})
+    bases = np.maximum(bases, 0.0)
+    k = np.searchsorted(TRAMOS_INICIO, bases, side='right') - 1
+    return TRAMOS_CUOTA[k] + TRAMOS_TIPO[k] * (bases - TRAMOS_INICIO[k])
+
+
 def calcular_irpf_ganancias(df_ganancias: pd.DataFrame) -> pd.DataFrame:
     """
     Aplica la escala progresiva de IRPF sobre ganancias patrimoniales.
@@ -122,23 +264,7 @@ def calcular_irpf_ganancias(df_ganancias: pd.DataFrame) -> pd.DataFrame:
       ['base_imponible_eur','irpf_ganancias_eur']
     """
     total_gan = df_ganancias['ganancia_perdida_eur'].sum() if not df_ganancias.empty else 0.0
-    restante = total_gan
-    irpf = 0.0
-
-    # Definición de tramos
-    tramos = [
-        (6000.0, 0.19),
-        (50000.0 - 6000.0, 0.21),
-        (200000.0 - 50000.0, 0.23),
-        (float('inf'), 0.26)
-    ]
-
-    for limite, tipo in tramos:
-        if restante <= 0:
-            break
-        aplicable = min(restante, limite)
-        irpf += aplicable * tipo
-        restante -= aplicable
+    irpf = float(cuota_irpf_ganancias(total_gan))
 
     return pd.DataFrame([{
         'base_imponible_eur': round(total_gan, 2),
@@ -1,51 +1,60 @@
 # logic/transformers.py
 
 import pandas as pd
-from .api_pricing import obtener_precio_historico_eur, normalizar_simbolo_app
-
-# Mapa de exchanges a sus funciones de transformación adaptadas
+from .api_pricing import (
+    obtener_precio_historico_eur,
+    obtener_precios_historicos_eur,
+    normalizar_simbolo_app
+)
+from . import _legacy_transformers_adapted as _L
+
+# Mapa de exchanges a sus funciones de transformación adaptadas (resueltas al importar)
 TRANSFORMERS = {
-    "Binance": "transformar_binance_adaptado",
-    "Koinly":  "transformar_koinly_adaptado",
-    "Coinbase": "transformar_coinbase_placeholder_adaptado",
-    "Kraken":  "transformar_kraken_placeholder_adaptado",
-    "KuCoin":  "transformar_kucoin_placeholder_adaptado",
+    "Binance": _L.transformar_binance_adaptado,
+    "Koinly":  _L.transformar_koinly_adaptado,
+    "Coinbase": _L.transformar_coinbase_placeholder_adaptado,
+    "Kraken":  _L.transformar_kraken_placeholder_adaptado,
+    "KuCoin":  _L.transformar_kucoin_placeholder_adaptado,
 }
 
-def transformar_csv_exchange(df_raw: pd.DataFrame, exchange_name: str):
+def transformar_csv_exchange(df_raw: pd.DataFrame, exchange_name: str, hilos_precios: int = 8):
     """
     Recibe un DataFrame crudo de un CSV y el nombre del exchange, 
     retorna (df_estandarizado, lista_errores_precio).
     Usa el transformador legacy correspondiente, pasándole
-    obtener_precio_historico_eur para USD→EUR.
+    obtener_precio_historico_eur para USD→EUR y obtener_precios_historicos_eur
+    para resolver todos los precios del CSV en bloque (con hasta hilos_precios
+    descargas a la vez).
+    El transformador recibe una copia superficial (comparte los datos con
+    df_raw): puede añadir columnas o filtrar, pero no modificar celdas en su sitio.
     """
-    # 1) Normalizar columnas a minúsculas sin espacios
-    df = df_raw.copy()
+    # 1) Normalizar columnas a minúsculas sin espacios (sin copiar los datos)
+    df = df_raw.copy(deep=False)
     df.columns = [str(c).strip().lower() for c in df.columns]
 
     # 2) Normalizar símbolos en columna 'symbol' o 'cripto' si existiera
     #    (algunos legados esperan ya una columna 'cripto' homogénea)
     if 'symbol' in df.columns and 'cripto' not in df.columns:
-        df = df.rename(columns={'symbol': 'cripto'})
+        df.rename(columns={'symbol': 'cripto'}, inplace=True)
 
     # 3) Escoger el transformador según exchange_name
-    func_name = TRANSFORMERS.get(exchange_name)
-    if not func_name:
+    transform_fn = TRANSFORMERS.get(exchange_name)
+    if not transform_fn:
         # Exchange no soportado
         columnas = ['fecha', 'tipo', 'cripto', 'cantidad', 'valor_eur', 'fee_eur']
         return pd.DataFrame(columns=columnas), []
 
-    # 4) Import dinámico de la función del módulo legacy
-    module = __import__('logic._legacy_transformers_adapted', fromlist=[func_name])
-    transform_fn = getattr(module, func_name, None)
-    if not transform_fn:
-        raise ImportError(f"No se encontró la función {func_name} en _legacy_transformers_adapted.py")
-
-    # 5) Llamada al transformador, pasándole la función real de pricing
-    df_std, errores = transform_fn(df, obtener_precio_historico_eur)
+    # 4) Llamada al transformador, pasándole las funciones reales de pricing
+    df_std, errores = transform_fn(
+        df,
+        obtener_precio_historico_eur,
+        lambda pares: obtener_precios_historicos_eur(pares, max_workers=hilos_precios)
+    )
 
-    # 6) Asegurar que la columna 'cripto' está normalizada
+    # 5) Asegurar que la columna 'cripto' está normalizada
+    #    (hay pocos símbolos distintos: se normaliza cada uno una vez y se mapea)
     if 'cripto' in df_std.columns:
-        df_std['cripto'] = df_std['cripto'].apply(normalizar_simbolo_app)
+        simbolos = {s: normalizar_simbolo_app(s) for s in df_std['cripto'].unique()}
+        df_std['cripto'] = df_std['cripto'].map(simbolos).astype('category')
 
     return df_std, errores